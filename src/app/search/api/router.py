@@ -39,7 +39,7 @@ router = APIRouter()
 logger = logger_utils(__name__)
 
 
-def get_params(
+async def get_params(
     body: SearchQuery,
     nb_results: int = 30,
     subject: str | None = None,
@@ -184,7 +184,7 @@ async def multi_search_all_slices_by_lang(
     results = await search_multi_inputs(
         qp=qp,
         background_tasks=background_tasks,
-        callback_function=sp.search_handler,
+        batch_search_handler=sp.search_batch_handler,
     )
     if not results:
         logger.error("No results found")
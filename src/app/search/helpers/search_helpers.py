@@ -1,40 +1,36 @@
-import asyncio
-from typing import Awaitable, Callable
+from typing import Awaitable, Protocol
 
 from fastapi import BackgroundTasks
 from qdrant_client.http.models import ScoredPoint
 
-from src.app.search.models.search import EnhancedSearchQuery, SearchMethods
+from src.app.search.models.search import EnhancedSearchQuery
 from src.app.shared.domain.exceptions import handle_error
 from src.app.utils.logger import logger as logger_utils
 
 logger = logger_utils(__name__)
 
 
+class BatchSearchHandler(Protocol):
+    """Search every query of qp in one go, returning one result list per query"""
+
+    def __call__(
+        self, background_tasks: BackgroundTasks, qp: EnhancedSearchQuery
+    ) -> Awaitable[list[list[ScoredPoint]]]: ...
+
+
 async def search_multi_inputs(
     background_tasks: BackgroundTasks,
     qp: EnhancedSearchQuery,
-    callback_function: Callable[..., Awaitable[list[ScoredPoint]]],
+    batch_search_handler: BatchSearchHandler,
 ) -> list[ScoredPoint] | None:
     try:
-        qps: list[EnhancedSearchQuery] = []
-        for query in qp.query:
-            temp_qp = qp.model_copy()
-            temp_qp.query = query
-            qps.append(temp_qp)
-
-        tasks = [
-            callback_function(
-                qp=qp,
-                background_tasks=background_tasks,
-                method=SearchMethods.BY_SLICES,
-            )
-            for qp in qps
-        ]
+        results = await batch_search_handler(
+            qp=qp,
+            background_tasks=background_tasks,
+        )
 
         all_data: list[ScoredPoint] = []
-        for coroutine in asyncio.as_completed(tasks):
-            data = await coroutine
+        for data in results:
             if data:
                 all_data.extend(data)
 
@@ -1,6 +1,7 @@
 # src/app/services/search.py
 
 import time
+from collections import OrderedDict
 from typing import Tuple, cast
 
 import numpy as np
@@ -12,7 +13,6 @@ from qdrant_client import AsyncQdrantClient
 from qdrant_client import models as qdrant_models
 from qdrant_client.http import exceptions as qdrant_exceptions
 from qdrant_client.http import models as http_models
-from sklearn.metrics.pairwise import cosine_similarity
 from transformers import AutoModel, AutoTokenizer
 
 from src.app.models.collections import Collection
@@ -39,15 +39,53 @@ async def get_qdrant(request: Request) -> AsyncQdrantClient:
     return request.app.state.qdrant
 
 
+class QueryEmbeddingCache:
+    """Query embeddings keyed by (model, query), evicted least recently used first"""
+
+    def __init__(self, maxsize: int = 1024):
+        self.maxsize = maxsize
+        self._embeddings: OrderedDict[tuple[str, str], np.ndarray] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._embeddings)
+
+    def __contains__(self, key: tuple[str, str]) -> bool:
+        return key in self._embeddings
+
+    def get(self, curr_model: str, search_input: str) -> np.ndarray | None:
+        embedding = self._embeddings.get((curr_model, search_input))
+        if embedding is not None:
+            self._embeddings.move_to_end((curr_model, search_input))
+        return embedding
+
+    def put(self, curr_model: str, search_input: str, embedding: np.ndarray) -> None:
+        # cached arrays are handed to every later caller: make them read-only
+        embedding.flags.writeable = False
+        self._embeddings[(curr_model, search_input)] = embedding
+        self._embeddings.move_to_end((curr_model, search_input))
+        if len(self._embeddings) > self.maxsize:
+            self._embeddings.popitem(last=False)
+
+    def clear(self) -> None:
+        self._embeddings.clear()
+
+
+# shared by the services built for each request, see get_search_service
+query_embeddings_cache = QueryEmbeddingCache()
+
+
 class SearchService:
     import threading
 
     model = {}
 
-    def __init__(self, client):
+    def __init__(self, client, query_embeddings: QueryEmbeddingCache | None = None):
         logger.debug("SearchService=init_searchService")
         self.client = client
         self.collections = None
+        self.query_embeddings = (
+            QueryEmbeddingCache() if query_embeddings is None else query_embeddings
+        )
 
         self.payload_keys = [
             "document_title",
@@ -72,9 +110,11 @@ class SearchService:
 
     @staticmethod
     def flavored_with_subject(
-        sdg_emb: ndarray, subject_emb: ndarray, discipline_factor: int | float = 2
+        sdg_emb: ndarray,
+        subject_emb: ndarray | list[float],
+        discipline_factor: int | float = 2,
     ):
-        embedding = sdg_emb + (discipline_factor * subject_emb)
+        embedding = sdg_emb + (discipline_factor * np.asarray(subject_emb))
 
         return embedding
 
@@ -200,6 +240,29 @@ class SearchService:
 
     @log_time_and_error_sync
     async def _embed_query(self, search_input: str, curr_model: str) -> np.ndarray:
+        cached = self.query_embeddings.get(curr_model, search_input)
+        if cached is not None:
+            return cached
+
+        embeddings = await self._embed_queries([search_input], curr_model)
+        return embeddings[0]
+
+    @log_time_and_error
+    async def _embed_queries(
+        self, search_inputs: list[str], curr_model: str
+    ) -> list[np.ndarray]:
+        cached = [
+            self.query_embeddings.get(curr_model, search_input)
+            for search_input in search_inputs
+        ]
+        missing = [
+            search_input
+            for search_input, embedding in zip(search_inputs, cached)
+            if embedding is None
+        ]
+        if not missing:
+            return cast(list[np.ndarray], cached)
+
         logger.debug("Creating embeddings model=%s", curr_model)
         time_start = time.time()
         if curr_model not in self.model:
@@ -208,13 +271,17 @@ class SearchService:
         seq_len = self.model[curr_model]["max_seq_length"]
         model = self.model[curr_model]["instance"]
         tokenizer = self.model[curr_model]["tokenizer"]
-        inputs = self._split_input_seq_len(seq_len, search_input)
+        split_inputs = [
+            self._split_input_seq_len(seq_len, search_input) for search_input in missing
+        ]
 
         try:
             embeddings = await run_in_threadpool(
-                self._compute_embeddings, model, tokenizer, inputs
+                self._compute_embeddings,
+                model,
+                tokenizer,
+                [chunk for inputs in split_inputs for chunk in inputs],
             )
-            embeddings = np.mean(embeddings, axis=0)
         except Exception as ex:
             logger.error("api_error=EMBED_ERROR model=%s", curr_model)
             raise RuntimeError("Not able to create embed", "EMBED_ERROR") from ex
@@ -222,10 +289,20 @@ class SearchService:
         logger.debug(
             "Creating embeddings time_elapsed=%s query_length=%s model=%s",
             round(time_end - time_start, 2),
-            len(search_input),
+            sum(len(search_input) for search_input in missing),
             curr_model,
         )
-        return cast(np.ndarray, embeddings)
+
+        # every query is the mean of the embeddings of its own chunks
+        bounds = np.cumsum([len(inputs) for inputs in split_inputs])[:-1]
+        computed = iter(np.split(embeddings, bounds))
+        results = []
+        for search_input, embedding in zip(search_inputs, cached):
+            if embedding is None:
+                embedding = np.mean(next(computed), axis=0)
+                self.query_embeddings.put(curr_model, search_input, embedding)
+            results.append(embedding)
+        return results
 
     async def simple_search_handler(self, qp: EnhancedSearchQuery):
         model = await run_in_threadpool(
@@ -246,6 +323,49 @@ class SearchService:
 
         return result
 
+    @log_time_and_error_sync
+    def _build_filters(
+        self, qp: EnhancedSearchQuery, method: SearchMethods
+    ) -> qdrant_models.Filter | None:
+        filter_content = [
+            FilterDefinition(key="document_lang", value=qp.lang),
+            FilterDefinition(key="document_corpus", value=qp.corpora),
+            FilterDefinition(key="document_details.readability", value=qp.readability),
+            FilterDefinition(
+                key=(
+                    "slice_sdg" if method == SearchMethods.BY_SLICES else "document_sdg"
+                ),
+                value=qp.sdg_filter,
+            ),
+        ]
+
+        return SearchFilters(filters=filter_content).build_filters()
+
+    @log_time_and_error_sync
+    def _rank_results(
+        self,
+        data: list[http_models.ScoredPoint],
+        qp: EnhancedSearchQuery,
+        background_tasks: BackgroundTasks,
+    ) -> list[http_models.ScoredPoint]:
+        sorted_data = sort_slices_using_mmr(data, theta=qp.relevance_factor)
+
+        if qp.concatenate:
+            sorted_data = concatenate_same_doc_id_slices(sorted_data)
+        try:
+            dqc = DataQualityChecker(log_background_task=background_tasks)
+            sorted_data = dqc.remove_duplicates(
+                points_to_check=sorted_data,
+                keys_to_check=["document_desc", "document_title"],
+            )
+        except Exception as ex:
+            logger.error(
+                "Error during duplicate removal: %s, ignore it for letting the user see results",
+                ex,
+            )
+
+        return sorted_data
+
     @log_time_and_error
     async def search_handler(
         self,
@@ -267,19 +387,7 @@ class SearchService:
             subject_influence_factor=qp.influence_factor,
         )
 
-        filter_content = [
-            FilterDefinition(key="document_lang", value=qp.lang),
-            FilterDefinition(key="document_corpus", value=qp.corpora),
-            FilterDefinition(key="document_details.readability", value=qp.readability),
-            FilterDefinition(
-                key=(
-                    "slice_sdg" if method == SearchMethods.BY_SLICES else "document_sdg"
-                ),
-                value=qp.sdg_filter,
-            ),
-        ]
-
-        filters = SearchFilters(filters=filter_content).build_filters()
+        filters = self._build_filters(qp, method)
 
         data = []
         if method == "by_slices":
@@ -299,21 +407,7 @@ class SearchService:
         else:
             raise ValueError(f"Unknown search method: {method}")
 
-        sorted_data = sort_slices_using_mmr(data, theta=qp.relevance_factor)
-
-        if qp.concatenate:
-            sorted_data = concatenate_same_doc_id_slices(sorted_data)
-        try:
-            dqc = DataQualityChecker(log_background_task=background_tasks)
-            sorted_data = dqc.remove_duplicates(
-                points_to_check=sorted_data,
-                keys_to_check=["document_desc", "document_title"],
-            )
-        except Exception as ex:
-            logger.error(
-                "Error during duplicate removal: %s, ignore it for letting the user see results",
-                ex,
-            )
+        sorted_data = self._rank_results(data, qp, background_tasks)
 
         if without_vectors:
             points_without_vectors = [
@@ -323,6 +417,45 @@ class SearchService:
 
         return sorted_data
 
+    @log_time_and_error
+    async def search_batch_handler(
+        self,
+        background_tasks: BackgroundTasks,
+        qp: EnhancedSearchQuery,
+    ) -> list[list[http_models.ScoredPoint]]:
+        """
+        Search slices for every query of qp at once: the queries are embedded in a
+        single pass and sent to qdrant in a single batch request.
+
+        Returns:
+            One list of sorted results per query, in the order of qp.query.
+        """
+        queries = [qp.query] if isinstance(qp.query, str) else qp.query
+
+        collection = await self.get_collection_by_language(lang="mul")
+        subject_vector = await run_in_threadpool(
+            get_subject_vector, qp.subject, collection.model
+        )
+        embeddings = await self._embed_queries(queries, collection.model)
+        if subject_vector:
+            embeddings = [
+                self.flavored_with_subject(
+                    sdg_emb=embedding,
+                    subject_emb=subject_vector,
+                    discipline_factor=qp.influence_factor,
+                )
+                for embedding in embeddings
+            ]
+
+        batch_data = await self.search_batch(
+            collection_info=collection.name,
+            embeddings=embeddings,
+            filters=self._build_filters(qp, SearchMethods.BY_SLICES),
+            nb_results=qp.nb_results,
+        )
+
+        return [self._rank_results(data, qp, background_tasks) for data in batch_data]
+
     @log_time_and_error
     async def search_group_by_document(
         self,
@@ -379,6 +512,40 @@ class SearchService:
             return []
         return resp.points
 
+    @log_time_and_error
+    async def search_batch(
+        self,
+        collection_info: str,
+        embeddings: list[np.ndarray],
+        filters: qdrant_models.Filter | None = None,
+        nb_results: int = 100,
+        with_vectors: bool = True,
+    ) -> list[list[http_models.ScoredPoint]]:
+        requests = [
+            qdrant_models.QueryRequest(
+                query=np.asarray(embedding).tolist(),
+                filter=filters,
+                limit=nb_results,
+                with_vector=with_vectors,
+                with_payload=self.payload_keys,
+                score_threshold=0.5,
+                params=qdrant_models.SearchParams(indexed_only=True),
+            )
+            for embedding in embeddings
+        ]
+        try:
+            responses = await self.client.query_batch_points(
+                collection_name=collection_info, requests=requests
+            )
+            logger.debug(
+                "method=search_batch collection=%s nb_queries=%s",
+                collection_info,
+                len(requests),
+            )
+        except qdrant_exceptions.ResponseHandlingException:
+            return [[] for _ in requests]
+        return [resp.points for resp in responses]
+
 
 @log_time_and_error_sync
 def sort_slices_using_mmr(
@@ -389,18 +556,34 @@ def sort_slices_using_mmr(
         return []
 
     logger.debug("sort_slices_using_mmr=start")
-    reward = [r.score for r in qdrant_results]
-    sim = cosine_similarity(np.array([r.vector for r in qdrant_results]))
+    nb_results = len(qdrant_results)
+    reward = np.fromiter((r.score for r in qdrant_results), np.float32, nb_results)
+    if theta == 1:
+        # no diversity term: after the first slice, MMR is a plain sort on score
+        order = np.argsort(-reward[1:], kind="stable") + 1
+        logger.debug("sort_slices_using_mmr=end")
+        return [qdrant_results[0], *(qdrant_results[i] for i in order)]
+
+    vectors = np.array([r.vector for r in qdrant_results], dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1)
+    norms[norms == 0] = 1.0
+    vectors /= norms[:, None]
+    sim = vectors @ vectors.T
 
     id_s = [0]
-    id_r = list(range(1, len(qdrant_results)))
-
-    while id_r:
-        marginal_relevance_scores = [
-            theta * reward[i] - (1 - theta) * max(sim[i, id_s]) for i in id_r
-        ]
-        j = np.argmax(marginal_relevance_scores)
-        id_s.append(id_r.pop(j))
+    remaining = np.ones(nb_results, dtype=bool)
+    remaining[0] = False
+    # highest similarity of every slice to the ones already selected, kept up to
+    # date with the last pick instead of recomputed over the whole selection
+    max_sim = sim[0].copy()
+
+    for _ in range(nb_results - 1):
+        marginal_relevance_scores = theta * reward - (1 - theta) * max_sim
+        marginal_relevance_scores[~remaining] = -np.inf
+        j = int(np.argmax(marginal_relevance_scores))
+        id_s.append(j)
+        remaining[j] = False
+        np.maximum(max_sim, sim[j], out=max_sim)
 
     logger.debug("sort_slices_using_mmr=end")
     return [qdrant_results[i] for i in id_s]
@@ -409,7 +592,7 @@ def sort_slices_using_mmr(
 async def get_search_service(
     qdrant: AsyncQdrantClient = Depends(get_qdrant),
 ) -> SearchService:
-    return SearchService(qdrant)
+    return SearchService(qdrant, query_embeddings=query_embeddings_cache)
 
 
 @log_time_and_error_sync
@@ -1,108 +1,42 @@
+import asyncio
 import uuid
 from types import SimpleNamespace
-from unittest import IsolatedAsyncioTestCase, mock
+from unittest import mock
 from unittest.mock import patch
+from urllib.parse import quote
 
-from fastapi.testclient import TestClient
-from qdrant_client.http import models
+import orjson
+import pytest
 
 from src.app.core.config import settings
 from src.app.models import collections
 from src.app.models.documents import Document, DocumentPayloadModel
 from src.app.search.models.search import EnhancedSearchQuery
-from src.app.search.services.search import SearchService, sort_slices_using_mmr
+from src.app.search.services.search import SearchService
 from src.app.shared.domain.exceptions import CollectionNotFoundError, ModelNotFoundError
-from src.main import app
 
-client = TestClient(app)
+# every test here shares the session event loop of the aclient fixture
+pytestmark = pytest.mark.asyncio(loop_scope="session")
 
 search_pipeline_path = "src.app.search.services.search.SearchService"
 
+_MODEL_NOT_FOUND = ModelNotFoundError("Model not found", "MODEL_NOT_FOUND")
+_COLL_NOT_FOUND = CollectionNotFoundError("Collection not found", "COLL_NOT_FOUND")
+
 mocked_collection = collections.Collection(
     lang="mul",
     model="model",
     name="collection_welearn_mul_model",
 )
-mocked_scored_points = [
-    models.ScoredPoint(
-        id="1",
-        version=1,
-        score=0.9,
-        vector=[0.1, 0.2],
-        payload={
-            "document_corpus": "corpus",
-            "document_desc": "desc",
-            "document_details": {},
-            "document_id": "1",
-            "document_lang": "fr",
-            "document_sdg": [1],
-            "document_title": "title",
-            "document_url": "url",
-            "slice_content": "content",
-            "slice_sdg": 1,
-        },
-    ),
-    models.ScoredPoint(
-        id="2",
-        version=1,
-        score=0.89,
-        vector=[0.11, 0.21],
-        payload={
-            "document_corpus": "corpus",
-            "document_desc": "desc",
-            "document_details": {},
-            "document_id": "1",
-            "document_lang": "fr",
-            "document_sdg": [1],
-            "document_title": "title",
-            "document_url": "url",
-            "slice_content": "content",
-            "slice_sdg": 1,
-        },
-    ),
-    models.ScoredPoint(
-        id="3",
-        version=1,
-        score=0.88,
-        vector=[0.3, 0.4],
-        payload={
-            "document_corpus": "corpus",
-            "document_desc": "desc",
-            "document_details": {},
-            "document_id": "1",
-            "document_lang": "fr",
-            "document_sdg": [1],
-            "document_title": "title",
-            "document_url": "url",
-            "slice_content": "content",
-            "slice_sdg": 1,
-        },
-    ),
-]
-
+# trusted literals: model_construct skips the pydantic validation of each document
 mocked_documents = [
-    Document(
-        score=0.9,
-        payload=DocumentPayloadModel(
-            document_corpus="corpus",
-            document_desc="desc",
-            document_details={},
-            document_id=uuid.UUID("12345678-1234-5678-1234-567812345678"),
-            document_lang="fr",
-            document_sdg=[1],
-            document_title="title",
-            document_url="url",
-            slice_content="content",
-            slice_sdg=1,
-        ),
-    ),
-    Document(
-        score=0.89,
-        payload=DocumentPayloadModel(
+    Document.model_construct(
+        score=score,
+        payload=DocumentPayloadModel.model_construct(
             document_corpus="corpus",
             document_desc="desc",
             document_details={},
-            document_id=uuid.UUID("12345678-1234-5678-1234-567812345678"),
+            document_id=uuid.UUID(document_id),
             document_lang="fr",
             document_sdg=[1],
             document_title="title",
@@ -110,48 +44,120 @@ mocked_documents = [
             slice_content="content",
             slice_sdg=1,
         ),
-    ),
-    Document(
-        score=0.88,
-        payload=DocumentPayloadModel(
-            document_corpus="corpus",
-            document_desc="desc",
-            document_details={},
-            document_id=uuid.UUID("12345678-1234-5678-1234-567812345678"),
-            document_lang="fr",
-            document_sdg=[1],
-            document_title="title",
-            document_url="url",
-            slice_content="content",
-            slice_sdg=1,
-        ),
-    ),
-    Document(
-        score=0.88,
-        payload=DocumentPayloadModel(
-            document_corpus="corpus",
-            document_desc="desc",
-            document_details={},
-            document_id=uuid.UUID("78901234-5678-9012-3456-789012345678"),  # UUID
-            document_lang="fr",
-            document_sdg=[1],
-            document_title="title",
-            document_url="url",
-            slice_content="content",
-            slice_sdg=1,
-        ),
-    ),
+    )
+    for score, document_id in (
+        (0.9, "12345678-1234-5678-1234-567812345678"),
+        (0.89, "12345678-1234-5678-1234-567812345678"),
+        (0.88, "12345678-1234-5678-1234-567812345678"),
+        (0.88, "78901234-5678-9012-3456-789012345678"),
+    )
 ]
 
+# search handlers shared by the tests that patch them, reset after each test
+_SEARCH_HANDLER_OK = mock.AsyncMock(return_value=mocked_documents)
+_SEARCH_HANDLER_EMPTY = mock.AsyncMock(return_value=[])
+_SEARCH_BATCH_HANDLER_EMPTY = mock.AsyncMock(return_value=[[], []])
+
 
 long_query = "français with a very long sentence to test what you are saying and if the issue is the size of the string"  # noqa: E501
+LONG_QUERY_QUOTED = quote(long_query, safe="")
 
+_API = settings.API_V1_STR
+SEARCH_COLLECTIONS_URL = f"{_API}/search/collections/collection_welearn_fr_model"
+SEARCH_COLLECTIONS_QUERY = (
+    f"{SEARCH_COLLECTIONS_URL}?query={LONG_QUERY_QUOTED}&nb_results=10"
+)
+SEARCH_MUL_COLLECTION_QUERY = (
+    f"{_API}/search/collections/collection_welearn_mul_model"
+    f"?query={quote('français', safe='')}&nb_results=10"
+)
+BY_SLICES_URL = f"{_API}/search/by_slices"
+BY_DOCUMENT_URL = f"{_API}/search/by_document"
+MULTIPLE_BY_SLICES_URL = f"{_API}/search/multiple_by_slices"
+BY_SLICES_QUERY = BY_SLICES_URL + "?nb_results=10"
+BY_DOCUMENT_QUERY = BY_DOCUMENT_URL + "?nb_results=10"
+MULTIPLE_BY_SLICES_QUERY = MULTIPLE_BY_SLICES_URL + "?nb_results=10"
+DOCUMENTS_BY_IDS_URL = f"{_API}/search/documents/by_ids"
+
+FR_QUERY = "une phrase plus longue pour tester la recherche en français. et voir ce que cela donne"  # noqa: E501
+# request bodies are serialised once, _post sends them as they are
+FR_QUERY_BODY = orjson.dumps({"query": FR_QUERY})
+MULTI_QUERY_BODY = orjson.dumps(
+    {
+        "query": [
+            FR_QUERY,
+            "another long sentence to test the search in english and see what happens",
+        ]
+    }
+)
+LONG_QUERY_BODY = orjson.dumps({"query": long_query})
+EMPTY_QUERY_BODY = orjson.dumps({"query": ""})
+NB_RESULTS_BODY = orjson.dumps({"nb_results": 10})
+RELEVANCE_QUERY_BODY = orjson.dumps(
+    {
+        "query": "Comment est-ce que les gouvernements font pour suivre ces conseils et les mettre en place ?",  # noqa: E501
+        "relevance_factor": 0.75,
+    }
+)
 
-@patch("src.app.services.sql_db.sql_service.session_maker")
-@mock.patch(
-    "src.app.shared.infra.security.check_api_key_sync",
-    new=mock.MagicMock(return_value=True),
+DOC_ID = "aaaaaaaa-aaaa-aaaa-aaaa-aaaaaaaaaaaa"
+CORPUS_ID = "bbbbbbbb-bbbb-bbbb-bbbb-bbbbbbbbbbbb"
+DOC_IDS_BODY = orjson.dumps([DOC_ID])
+EMPTY_IDS_BODY = orjson.dumps([])
+EXPECTED_SINGLE_DOC_PAYLOAD = {
+    "document_id": DOC_ID,
+    "document_title": "Title",
+    "document_url": "https://example.com",
+    "document_desc": "Desc",
+    "document_details": {"k": "v"},
+    "document_corpus": "Corpus",
+    "document_sdg": [1, 3],
+    "document_lang": "",
+    "slice_content": "",
+    "slice_sdg": None,
+}
+EXPECTED_MULTI_SINGLE_QUERY = EnhancedSearchQuery.model_construct(
+    query=[long_query],
+    sdg_filter=None,
+    corpora=None,
+    subject=None,
+    nb_results=10,
+    influence_factor=2.0,
+    relevance_factor=1.0,
 )
+
+HEADERS = {"X-API-Key": "test"}
+SESSION_HEADERS = {
+    **HEADERS,
+    "origin": "test.com",
+    "Cookie": f"x-session-id={uuid.uuid4()}",
+}
+
+
+async def _post(aclient, url, payload, headers=HEADERS):
+    return await aclient.post(
+        url,
+        content=payload,
+        headers={**headers, "Content-Type": "application/json"},
+    )
+
+
+def _mk_result(rows):
+    """Stand-in for a SQLAlchemy result: the queries only call .all() on it"""
+    return SimpleNamespace(all=lambda: rows)
+
+
+@pytest.fixture(autouse=True)
+def _reset_mocks():
+    yield
+    for handler in (
+        _SEARCH_HANDLER_OK,
+        _SEARCH_HANDLER_EMPTY,
+        _SEARCH_BATCH_HANDLER_EMPTY,
+    ):
+        handler.reset_mock()
+
+
 @patch(
     f"{search_pipeline_path}.get_collections",
     new=mock.AsyncMock(
@@ -162,406 +168,211 @@ long_query = "français with a very long sentence to test what you are saying an
         )
     ),
 )
-class SearchTests(IsolatedAsyncioTestCase):
-    def test_search_items_no_query(self, *mocks):
+class TestSearch:
+    async def test_search_items_no_query(self, aclient):
         """Test search_items when no query is provided"""
 
-        with TestClient(app) as client:
-            response = client.post(
-                f"{settings.API_V1_STR}/search/collections/collection_welearn_fr_model",  # noqa: E501
-                json={"nb_results": 10},
-                headers={"X-API-Key": "test"},
-            )
+        response = await _post(aclient, SEARCH_COLLECTIONS_URL, NB_RESULTS_BODY)
 
-            self.assertEqual(response.status_code, 422)
+        assert response.status_code == 422
 
     @patch(
         f"{search_pipeline_path}._get_model",
-        new=mock.MagicMock(
-            side_effect=ModelNotFoundError("Model not found", "MODEL_NOT_FOUND")
-        ),
-    )
-    async def test_search_model_not_found(self, *mocks):
-        with TestClient(app) as client:
-            response = client.post(
-                f"{settings.API_V1_STR}/search/collections/collection_welearn_mul_model?query=français&nb_results=10",
-                headers={"X-API-Key": "test"},
-            )
-
-            assert response.status_code == 404
-
-    @patch(
-        f"{search_pipeline_path}.search_handler",
-        new=mock.AsyncMock(return_value=mocked_documents),
+        new=mock.MagicMock(side_effect=_MODEL_NOT_FOUND),
     )
-    async def test_search_items_success(self, *mocks):
-        with TestClient(app) as client:
-            """Test successful search_items response"""
+    async def test_search_model_not_found(self, aclient):
+        response = await aclient.post(
+            SEARCH_MUL_COLLECTION_QUERY,
+            headers=HEADERS,
+        )
 
-            response = client.post(
-                f"{settings.API_V1_STR}/search/collections/collection_welearn_fr_model?query={long_query}&nb_results=10",
-                headers={"X-API-Key": "test"},  # noqa: E501
-            )
+        assert response.status_code == 404
 
-            self.assertEqual(response.status_code, 200)
+    @patch(f"{search_pipeline_path}.search_handler", new=_SEARCH_HANDLER_OK)
+    async def test_search_items_success(self, aclient):
+        """Test successful search_items response"""
 
-    @patch(
-        f"{search_pipeline_path}.search_handler",
-        new=mock.AsyncMock(return_value=[]),
-    )
-    async def test_search_items_no_result(self, *mocks):
-        with TestClient(app) as client:
-            response = client.post(
-                f"{settings.API_V1_STR}/search/collections/collection_welearn_fr_model?query={long_query}&nb_results=10",
-                headers={"X-API-Key": "test"},  # noqa: E501
-            )
+        response = await aclient.post(
+            SEARCH_COLLECTIONS_QUERY,
+            headers=HEADERS,
+        )
 
-            self.assertEqual(response.status_code, 206)
-            self.assertEqual(response.json(), [])
+        assert response.status_code == 200
 
-    @patch(
-        f"{search_pipeline_path}.get_collection_by_language",
-        new=mock.AsyncMock(
-            side_effect=CollectionNotFoundError(
-                "Collection not found", "COLL_NOT_FOUND"
-            )
-        ),
-    )
-    async def test_search_all_slices_no_collections(self, *mocks):
-        with TestClient(app) as client:
-            response = client.post(
-                f"{settings.API_V1_STR}/search/collections/collection_welearn_fr_model?query={long_query}&nb_results=10",
-                headers={"X-API-Key": "test"},
-            )
-            self.assertEqual(response.status_code, 404)
+    @patch(f"{search_pipeline_path}.search_handler", new=_SEARCH_HANDLER_EMPTY)
+    async def test_search_items_no_result(self, aclient):
+        response = await aclient.post(
+            SEARCH_COLLECTIONS_QUERY,
+            headers=HEADERS,
+        )
 
+        assert response.status_code == 206
+        assert orjson.loads(response.content) == []
 
-@patch("src.app.services.sql_db.sql_service.session_maker")
-@patch(
-    "src.app.shared.infra.security.check_api_key_sync",
-    new=mock.MagicMock(return_value=True),
-)
-class SearchTestsSlices(IsolatedAsyncioTestCase):
     @patch(
         f"{search_pipeline_path}.get_collection_by_language",
-        new=mock.AsyncMock(
-            side_effect=CollectionNotFoundError(
-                "Collection not found", "COLL_NOT_FOUND"
-            )
-        ),
+        new=mock.AsyncMock(side_effect=_COLL_NOT_FOUND),
     )
-    async def test_search_all_slices_no_collections(self, *mocks):
-        with TestClient(app) as client:
-            response = client.post(
-                f"{settings.API_V1_STR}/search/by_slices?nb_results=10",
-                json={
-                    "query": "une phrase plus longue pour tester la recherche en français. et voir ce que cela donne"
-                },  # noqa: E501
-                headers={"X-API-Key": "test"},
-            )
-            self.assertEqual(response.status_code, 404)
-
-    @patch(f"{search_pipeline_path}.search_handler", return_value=mocked_documents)
-    async def test_search_all_slices_ok(self, *mocks):
-        with TestClient(app) as client:
-            response = client.post(
-                f"{settings.API_V1_STR}/search/by_slices",
-                json={
-                    "query": "Comment est-ce que les gouvernements font pour suivre ces conseils et les mettre en place ?",
-                    "relevance_factor": 0.75,
-                },
-                headers={"X-API-Key": "test"},
-            )
-
-            self.assertEqual(response.status_code, 200)
+    async def test_search_all_slices_no_collections(self, aclient):
+        response = await aclient.post(
+            SEARCH_COLLECTIONS_QUERY,
+            headers=HEADERS,
+        )
+        assert response.status_code == 404
 
-    async def test_search_all_slices_no_query(self, *mocks):
-        with TestClient(app) as client:
-            response = client.post(
-                f"{settings.API_V1_STR}/search/by_slices",
-                json={"query": ""},
-                headers={"X-API-Key": "test"},
-            )
-            self.assertEqual(response.status_code, 400)
-            self.assertEqual(
-                response.json().get("detail")["message"],
-                "Empty query",
-            )
 
-    @patch(
-        f"{search_pipeline_path}.search_handler",
-        return_value=[],
+class TestSearchEndpoints:
+    @pytest.mark.parametrize(
+        "url, headers",
+        [(BY_SLICES_QUERY, HEADERS), (BY_DOCUMENT_QUERY, SESSION_HEADERS)],
+        ids=["by_slices", "by_document"],
     )
-    async def test_search_all_slices_no_result(self, *mocks):
-        with TestClient(app) as client:
-            response = client.post(
-                f"{settings.API_V1_STR}/search/by_slices?nb_results=10",
-                json={
-                    "query": "une phrase plus longue pour tester la recherche en français. et voir ce que cela donne"
-                },
-                headers={"X-API-Key": "test"},
-            )
-            self.assertEqual(response.status_code, 204)
-
-
-@patch("src.app.services.sql_db.queries.session_maker")
-@patch(
-    "src.app.shared.infra.security.check_api_key_sync",
-    new=mock.MagicMock(return_value=True),
-)
-class SearchTestsAll(IsolatedAsyncioTestCase):
-
     @patch(
         f"{search_pipeline_path}.get_collection_by_language",
-        new=mock.AsyncMock(
-            side_effect=CollectionNotFoundError(
-                "Collection not found", "COLL_NOT_FOUND"
-            )
-        ),
+        new=mock.AsyncMock(side_effect=_COLL_NOT_FOUND),
     )
     @patch(
         f"{search_pipeline_path}._get_info_from_collection_name",
         new=mock.MagicMock(return_value=mocked_collection),
     )
-    async def test_search_all_no_collections(self, *mocks):
-        with TestClient(app) as client:
-            response = client.post(
-                f"{settings.API_V1_STR}/search/by_document?nb_results=10",
-                json={
-                    "query": "une phrase plus longue pour tester la recherche en français. et voir ce que cela donne"
-                },
-                headers={
-                    "X-API-Key": "test",
-                    "origin": "test.com",
-                    "Cookie": f"x-session-id={str(uuid.uuid4())}",
-                },
-            )
-            self.assertEqual(response.status_code, 404)
-
-    @patch(f"{search_pipeline_path}.search_handler", return_value=[])
-    async def test_search_all_no_result(self, *mocks):
-        with TestClient(app) as client:
-            response = client.post(
-                f"{settings.API_V1_STR}/search/by_document?nb_results=10",
-                json={
-                    "query": "une phrase plus longue pour tester la recherche en français. et voir ce que cela donne"
-                },
-                headers={
-                    "X-API-Key": "test",
-                    "origin": "test.com",
-                    "Cookie": f"x-session-id={str(uuid.uuid4())}",
-                },  # noqa: E501
-            )
-
-            self.assertEqual(response.status_code, 204)
-
-    async def test_search_all_no_query(self, *mocks):
-        with TestClient(app) as client:
-            response = client.post(
-                f"{settings.API_V1_STR}/search/by_document",
-                json={"query": ""},
-                headers={
-                    "X-API-Key": "test",
-                    "origin": "test.com",
-                    "Cookie": f"x-session-id={str(uuid.uuid4())}",
-                },
-            )
-            self.assertEqual(response.status_code, 400)
-            self.assertEqual(
-                response.json().get("detail")["message"],
-                "Empty query",
-            )
-
-
-class TestSortSlicesUsingMMR(IsolatedAsyncioTestCase):
-    async def test_sort_slices_using_mmr_default_theta(self, *mocks):
-        sorted_points = sort_slices_using_mmr(mocked_scored_points)
-        self.assertEqual(sorted_points, mocked_scored_points)
-
-    async def test_sort_slices_using_mmr_custom_theta(self, *mocks):
-        theta = 0.5
-        sorted_points = sort_slices_using_mmr(mocked_scored_points, theta)
-        self.assertEqual(
-            sorted_points,
-            [mocked_scored_points[0], mocked_scored_points[2], mocked_scored_points[1]],
-        )
-
+    async def test_search_no_collections(self, aclient, url, headers):
+        response = await _post(aclient, url, FR_QUERY_BODY, headers)
+        assert response.status_code == 404
+
+    @patch(f"{search_pipeline_path}.search_handler", new=_SEARCH_HANDLER_OK)
+    async def test_search_all_slices_ok(self, aclient):
+        response = await _post(aclient, BY_SLICES_URL, RELEVANCE_QUERY_BODY)
+
+        assert response.status_code == 200
+
+    @pytest.mark.parametrize(
+        "url, headers",
+        [
+            (BY_SLICES_URL, HEADERS),
+            (BY_DOCUMENT_URL, SESSION_HEADERS),
+            (MULTIPLE_BY_SLICES_URL, HEADERS),
+        ],
+        ids=["by_slices", "by_document", "multiple_by_slices"],
+    )
+    async def test_search_no_query(self, aclient, url, headers):
+        response = await _post(aclient, url, EMPTY_QUERY_BODY, headers)
+        assert response.status_code == 400
+        body = orjson.loads(response.content)
+        assert body["detail"]["message"] == "Empty query"
 
-@patch("src.app.services.sql_db.queries.session_maker")
-@patch(
-    "src.app.shared.infra.security.check_api_key_sync",
-    new=mock.MagicMock(return_value=True),
-)
-class SearchTestsMultiInput(IsolatedAsyncioTestCase):
     @patch(
-        f"{search_pipeline_path}.search_handler",
-        return_value=[],
+        f"{search_pipeline_path}.search_batch_handler", new=_SEARCH_BATCH_HANDLER_EMPTY
     )
-    async def test_search_multi_no_result(self, *mocks):
-        with TestClient(app) as client:
-            response = client.post(
-                f"{settings.API_V1_STR}/search/multiple_by_slices?nb_results=10",
-                json={
-                    "query": [
-                        "une phrase plus longue pour tester la recherche en français. et voir ce que cela donne",
-                        "another long sentence to test the search in english and see what happens",
-                    ]
-                },
-                headers={"X-API-Key": "test"},
-            )
-            self.assertEqual(response.status_code, 204)
+    @patch(f"{search_pipeline_path}.search_handler", new=_SEARCH_HANDLER_EMPTY)
+    async def test_search_no_result(self, aclient):
+        responses = await asyncio.gather(
+            _post(aclient, BY_SLICES_QUERY, FR_QUERY_BODY),
+            _post(aclient, BY_DOCUMENT_QUERY, FR_QUERY_BODY, SESSION_HEADERS),
+            _post(aclient, MULTIPLE_BY_SLICES_QUERY, MULTI_QUERY_BODY),
+        )
+        assert [response.status_code for response in responses] == [204, 204, 204]
+        assert _SEARCH_HANDLER_EMPTY.await_count == 2
+        _SEARCH_BATCH_HANDLER_EMPTY.assert_awaited_once()
 
 
-@patch("src.app.services.sql_db.queries.session_maker")
-@patch(
-    "src.app.shared.infra.security.check_api_key_sync",
-    new=mock.MagicMock(return_value=True),
-)
-class DocumentsByIdsTests(IsolatedAsyncioTestCase):
-    async def test_documents_by_ids_empty(self, session_maker_mock, *mocks):
+@pytest.fixture
+def multi_search_mocks():
+    with mock.patch(
+        "src.app.search.api.router.search_multi_inputs"
+    ) as search_multi, mock.patch.object(
+        SearchService, "search_batch_handler", return_value=[mocked_documents]
+    ) as search_batch_handler:
+        yield search_multi, search_batch_handler
+
 
+class TestDocumentsByIds:
+    async def test_documents_by_ids_empty(self, session_maker_mock, aclient):
         session = session_maker_mock.return_value.__enter__.return_value
-        exec_docs = mock.MagicMock()
-        exec_docs.all.return_value = []
-        exec_corpora = mock.MagicMock()
-        exec_corpora.all.return_value = []
-        exec_slices = mock.MagicMock()
-        exec_slices.all.return_value = []
-        exec_sdgs = mock.MagicMock()
-        exec_sdgs.all.return_value = []
-
-        session.execute.side_effect = [exec_docs, exec_corpora, exec_slices, exec_sdgs]
-
-        with TestClient(app) as client:
-            response = client.post(
-                f"{settings.API_V1_STR}/search/documents/by_ids",
-                json=[],
-                headers={"X-API-Key": "test"},
-            )
+        session.execute.side_effect = iter(
+            [_mk_result([]), _mk_result([]), _mk_result([]), _mk_result([])]
+        )
 
-            self.assertEqual(response.status_code, 200)
-            self.assertEqual(response.json(), [])
+        response = await _post(aclient, DOCUMENTS_BY_IDS_URL, EMPTY_IDS_BODY)
 
-    async def test_documents_by_ids_single_doc(self, session_maker_mock, *mocks):
-        session = session_maker_mock.return_value.__enter__.return_value
+        assert response.status_code == 200
+        assert orjson.loads(response.content) == []
 
-        doc_id = "aaaaaaaa-aaaa-aaaa-aaaa-aaaaaaaaaaaa"
-        corpus_id = "bbbbbbbb-bbbb-bbbb-bbbb-bbbbbbbbbbbb"
-        docs_row = SimpleNamespace(
-            title="Title",
-            url="https://example.com",
-            corpus_id=corpus_id,
-            id=doc_id,
-            description="Desc",
-            details={"k": "v"},
-        )
+    async def test_documents_by_ids_single_doc(self, session_maker_mock, aclient):
+        session = session_maker_mock.return_value.__enter__.return_value
 
-        # 1) documents .all()
-        exec_docs = mock.MagicMock()
-        exec_docs.all.return_value = [docs_row]
-        # 2) corpora .all()
-        exec_corpora = mock.MagicMock()
-        exec_corpora.all.return_value = [
-            SimpleNamespace(id=corpus_id, source_name="Corpus")
-        ]
-        # 3) slices .all()
+        doc_id = DOC_ID
+        corpus_id = CORPUS_ID
         slice1 = "11111111-1111-1111-1111-111111111111"
         slice2 = "22222222-2222-2222-2222-222222222222"
-        exec_slices = mock.MagicMock()
-        exec_slices.all.return_value = [
+        docs_rows = [
+            SimpleNamespace(
+                title="Title",
+                url="https://example.com",
+                corpus_id=corpus_id,
+                id=doc_id,
+                description="Desc",
+                details={"k": "v"},
+            )
+        ]
+        corpora_rows = [SimpleNamespace(id=corpus_id, source_name="Corpus")]
+        slices_rows = [
             SimpleNamespace(id=slice1, document_id=doc_id),
             SimpleNamespace(id=slice2, document_id=doc_id),
         ]
-        # 4) sdgs .all()
-        exec_sdgs = mock.MagicMock()
-        exec_sdgs.all.return_value = [
+        sdgs_rows = [
             SimpleNamespace(sdg_number=1, slice_id=slice1),
             SimpleNamespace(sdg_number=3, slice_id=slice2),
             SimpleNamespace(sdg_number=1, slice_id=slice2),
         ]
 
-        session.execute.side_effect = [exec_docs, exec_corpora, exec_slices, exec_sdgs]
-
-        response = client.post(
-            f"{settings.API_V1_STR}/search/documents/by_ids",
-            json=[doc_id],
-            headers={"X-API-Key": "test"},
+        # documents, corpora, slices then sdgs, in query order
+        session.execute.side_effect = iter(
+            [
+                _mk_result(docs_rows),
+                _mk_result(corpora_rows),
+                _mk_result(slices_rows),
+                _mk_result(sdgs_rows),
+            ]
         )
 
-        self.assertEqual(response.status_code, 200)
-        body = response.json()
-        self.assertEqual(len(body), 1)
-        payload = body[0]["payload"]
-        self.assertEqual(payload["document_id"], doc_id)
-        self.assertEqual(payload["document_title"], "Title")
-        self.assertEqual(payload["document_url"], "https://example.com")
-        self.assertEqual(payload["document_desc"], "Desc")
-        self.assertEqual(payload["document_details"], {"k": "v"})
-        self.assertEqual(payload["document_corpus"], "Corpus")
-        self.assertEqual(payload["document_sdg"], [1, 3])
-        self.assertEqual(payload["slice_content"], "")
-        self.assertIsNone(payload["slice_sdg"])
-
-    async def test_documents_by_ids_corpus_missing(self, session_maker_mock, *mocks):
+        response = await _post(aclient, DOCUMENTS_BY_IDS_URL, DOC_IDS_BODY)
+
+        assert response.status_code == 200
+        body = orjson.loads(response.content)
+        assert len(body) == 1
+        assert body[0]["payload"] == EXPECTED_SINGLE_DOC_PAYLOAD
+
+    async def test_documents_by_ids_corpus_missing(self, session_maker_mock, aclient):
         session = session_maker_mock.return_value.__enter__.return_value
 
-        doc_id = "aaaaaaaa-aaaa-aaaa-aaaa-aaaaaaaaaaaa"
-        corpus_id = "bbbbbbbb-bbbb-bbbb-bbbb-bbbbbbbbbbbb"
-        docs_row = SimpleNamespace(
-            title="Title",
-            url="https://example.com",
-            corpus_id=corpus_id,
-            id=doc_id,
-            description="Desc",
-            details={},
+        doc_id = DOC_ID
+        docs_rows = [
+            SimpleNamespace(
+                title="Title",
+                url="https://example.com",
+                corpus_id=CORPUS_ID,
+                id=doc_id,
+                description="Desc",
+                details={},
+            )
+        ]
+        session.execute.side_effect = iter(
+            [_mk_result(docs_rows), _mk_result([]), _mk_result([]), _mk_result([])]
         )
 
-        exec_docs = mock.MagicMock()
-        exec_docs.all.return_value = [docs_row]
-        exec_corpora = mock.MagicMock()
-        exec_corpora.all.return_value = []
-        exec_slices = mock.MagicMock()
-        exec_slices.all.return_value = []
-        exec_sdgs = mock.MagicMock()
-        exec_sdgs.all.return_value = []
-        session.execute.side_effect = [exec_docs, exec_corpora, exec_slices, exec_sdgs]
-
-        with TestClient(app) as client:
-            response = client.post(
-                f"{settings.API_V1_STR}/search/documents/by_ids",
-                json=[doc_id],
-                headers={"X-API-Key": "test"},
-            )
-            self.assertEqual(response.status_code, 200)
-            body = response.json()
-            payload = body[0]["payload"]
-            self.assertEqual(len(body), 1)
-            self.assertEqual(payload["document_corpus"], "")
-
-    async def test_search_multi_single_query(self, *mocks):
-        with mock.patch(
-            "src.app.search.api.router.search_multi_inputs",
-        ) as search_multi, mock.patch.object(
-            SearchService, "search_handler", return_value=mocked_documents
-        ) as search_handler:
-            with TestClient(app) as _client:
-                _client.post(
-                    f"{settings.API_V1_STR}/search/multiple_by_slices?nb_results=10",
-                    json={
-                        "query": long_query,
-                    },
-                    headers={"X-API-Key": "test"},
-                )
-                search_multi.assert_called_once_with(
-                    qp=EnhancedSearchQuery(
-                        query=[long_query],
-                        sdg_filter=None,
-                        corpora=None,
-                        subject=None,
-                        nb_results=10,
-                        influence_factor=2.0,
-                        relevance_factor=1.0,
-                    ),
-                    background_tasks=mock.ANY,
-                    callback_function=search_handler,  # noqa: E501
-                )
+        response = await _post(aclient, DOCUMENTS_BY_IDS_URL, DOC_IDS_BODY)
+        assert response.status_code == 200
+        body = orjson.loads(response.content)
+        assert len(body) == 1
+        assert body[0]["payload"]["document_corpus"] == ""
+
+    async def test_search_multi_single_query(self, multi_search_mocks, aclient):
+        search_multi, search_batch_handler = multi_search_mocks
+
+        await _post(aclient, MULTIPLE_BY_SLICES_QUERY, LONG_QUERY_BODY)
+
+        search_multi.assert_called_once_with(
+            qp=EXPECTED_MULTI_SINGLE_QUERY,
+            background_tasks=mock.ANY,
+            batch_search_handler=search_batch_handler,
+        )
@@ -0,0 +1,141 @@
+from pathlib import Path
+from unittest import mock
+
+import httpx
+import pytest
+from qdrant_client.models import ScoredPoint
+
+from src.app.core.config import settings
+from src.app.search.services.search import SearchService
+from src.app.shared.domain.exceptions import NoResultsError
+from src.app.tutor.service.models import ExtractorOutput, ExtractorOutputList
+
+pytestmark = pytest.mark.asyncio(loop_scope="session")
+
+_API = settings.API_V1_STR
+FILES_CONTENT_URL = f"{_API}/tutor/files/content"
+SEARCH_EXTRACTS_URL = f"{_API}/tutor/search_extracts"
+
+TUTOR_TEST_FILE = Path(__file__).parents[2] / "tests_files" / "tutor_test_file.txt"
+
+
+def _multipart(filename, content):
+    """Encode a single file upload once, as (body, headers) for ``content=``."""
+    request = httpx.Request(
+        "POST", FILES_CONTENT_URL, files={"files": (filename, content, "text/plain")}
+    )
+    return request.read(), {"Content-Type": request.headers["Content-Type"]}
+
+
+EMPTY_FILE_BODY, EMPTY_FILE_HEADERS = _multipart("test.txt", b"")
+TEST_FILE_BODY, TEST_FILE_HEADERS = _multipart(
+    TUTOR_TEST_FILE.name, TUTOR_TEST_FILE.read_bytes()
+)
+
+EXTRACTS = ExtractorOutputList(
+    extracts=[
+        ExtractorOutput(
+            summary="summary",
+            themes=[{"theme": "theme", "reason": "reason"}],
+        )
+    ]
+)
+
+_RUN_LLM = mock.AsyncMock(return_value=EXTRACTS)
+
+
+@pytest.fixture(autouse=True)
+def _reset_run_llm():
+    yield
+    _RUN_LLM.reset_mock()
+
+
+@mock.patch(
+    "src.app.shared.infra.abst_chat.AbstractChat.run_llm_with_json_parsing",
+    new=_RUN_LLM,
+)
+class TestTutorFilesContent:
+    async def test_tutor_no_files(self, aclient):
+        response = await aclient.post(FILES_CONTENT_URL)
+
+        assert response.status_code == 422
+        _RUN_LLM.assert_not_called()
+
+    async def test_tutor_empty_file(self, aclient):
+        response = await aclient.post(
+            FILES_CONTENT_URL, content=EMPTY_FILE_BODY, headers=EMPTY_FILE_HEADERS
+        )
+
+        assert response.status_code == 400
+        _RUN_LLM.assert_not_called()
+
+    async def test_tutor_file(self, aclient):
+        response = await aclient.post(
+            FILES_CONTENT_URL, content=TEST_FILE_BODY, headers=TEST_FILE_HEADERS
+        )
+
+        assert response.status_code == 200
+        assert response.json() == EXTRACTS.model_dump()
+        messages = _RUN_LLM.await_args.args[0]
+        assert "this is a mocked text file" in messages[1]["content"]
+
+
+SUMMARIES_BODY = {"summaries": ["first summary", "second summary", "third summary"]}
+
+
+def _point(point_id: int, score: float) -> ScoredPoint:
+    return ScoredPoint(id=point_id, version=1, score=score, payload={})
+
+
+@pytest.fixture
+def search_batch_handler():
+    with mock.patch.object(SearchService, "search_batch_handler") as handler:
+        yield handler
+
+
+class TestTutorSearchExtracts:
+    async def test_search_extracts_keeps_query_order(
+        self, search_batch_handler, aclient
+    ):
+        search_batch_handler.return_value = [
+            [_point(1, 0.9), _point(2, 0.8)],
+            [],
+            [_point(3, 0.95)],
+        ]
+
+        response = await aclient.post(SEARCH_EXTRACTS_URL, json=SUMMARIES_BODY)
+
+        assert response.status_code == 200
+        body = response.json()
+        assert body["nb_results"] == 3
+        assert [doc["id"] for doc in body["documents"]] == [1, 2, 3]
+        qp = search_batch_handler.await_args.kwargs["qp"]
+        assert qp.query == SUMMARIES_BODY["summaries"]
+        assert qp.nb_results == 15
+
+    @pytest.mark.parametrize(
+        "handler_kwargs",
+        [
+            {"return_value": [[], [], []]},
+            {"side_effect": RuntimeError("Not able to create embed", "EMBED_ERROR")},
+        ],
+        ids=["qdrant_error", "embed_error"],
+    )
+    async def test_search_extracts_batch_failure(
+        self, search_batch_handler, handler_kwargs, aclient
+    ):
+        search_batch_handler.configure_mock(**handler_kwargs)
+
+        response = await aclient.post(SEARCH_EXTRACTS_URL, json=SUMMARIES_BODY)
+
+        assert response.status_code == 200
+        assert response.json() == {"extracts": [], "nb_results": 0, "documents": []}
+        search_batch_handler.assert_awaited_once()
+
+    async def test_search_extracts_no_results(self, search_batch_handler, aclient):
+        search_batch_handler.side_effect = NoResultsError()
+
+        response = await aclient.post(SEARCH_EXTRACTS_URL, json=SUMMARIES_BODY)
+
+        assert response.status_code == 404
+        assert response.json()["nb_results"] == 0
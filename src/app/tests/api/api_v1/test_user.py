@@ -1,363 +1,296 @@
-import unittest
 import uuid
+from types import SimpleNamespace
 from unittest import mock
-from unittest.mock import MagicMock
 
-from fastapi.testclient import TestClient
+import pytest
 from welearn_database.data.models import InferredUser, Session
 
 from src.app.core.config import settings
+from src.app.services.sql_db import queries_user
 from src.app.shared.domain.exceptions import UserNotFoundError
-from src.main import app
 
-client = TestClient(app)
+pytestmark = pytest.mark.asyncio(loop_scope="session")
 
+_API = settings.API_V1_STR
+USER_URL = f"{_API}/user/user"
+SESSION_URL = f"{_API}/user/session"
+USER_BOOKMARKS_URL = f"{_API}/user/:user_id/bookmarks"
+BOOKMARKS_URL = f"{_API}/user/bookmarks"
+BOOKMARK_URL = f"{_API}/user/bookmarks/:document_id"
+INSTITUTION_DATA_URL = f"{_API}/user/institution-data"
 
-@mock.patch(
-    "src.app.shared.infra.security.check_api_key_sync",
-    new=mock.MagicMock(return_value=True),
-)
-class UserApiTests(unittest.IsolatedAsyncioTestCase):
+USER_ID = "cfc8072c-a055-442a-9878-b5a73d9141b2"
+SESSION_ID = "bdb62bb2-1fe5-4d14-92fd-60a041355aea"
+# rows returned by first(): the queries only read .id, or [0] for a Session entity
+USER_ROW = SimpleNamespace(id=USER_ID)
+SESSION_ROW = SimpleNamespace(id=SESSION_ID)
+SESSION_ENTITY_ROW = (SimpleNamespace(inferred_user_id=USER_ID),)
 
-    @mock.patch("src.app.services.sql_db.queries_user.session_maker")
-    async def test_create_user_when_not_exists(self, session_maker_mock, *mocks):
-        """Si user_id non fourni, crée un nouvel utilisateur"""
-        session = MagicMock()
-        session_maker_mock.return_value.__enter__.return_value = session
 
-        response = client.post(
-            f"{settings.API_V1_STR}/user/user",
-            headers={"X-API-Key": "test"},
-        )
+class FakeSession:
+    """The slice of a SQLAlchemy session used by the user queries.
 
-        self.assertEqual(response.status_code, 200)
-        self.assertIn("user_id", response.json())
-        session.add.assert_called_once()
-        session.commit.assert_called_once()
-        user_in_db: InferredUser = session.add.call_args[0][0]
-        self.assertEqual(user_in_db.id, response.json()["user_id"])
-        self.assertIsNone(user_in_db.origin_referrer)
-
-    @mock.patch("src.app.services.sql_db.queries_user.session_maker")
-    async def test_create_user_when_not_exists_with_referer(
-        self, session_maker_mock, *mocks
-    ):
-        """Si user_id non fourni, crée un nouvel utilisateur"""
-        session = MagicMock()
-        session_maker_mock.return_value.__enter__.return_value = session
+    ``first`` is returned by every ``first()`` call, ``firsts`` by successive ones.
+    The session is its own ``execute()`` result.
+    """
 
-        response = client.post(
-            f"{settings.API_V1_STR}/user/user?referer=test_referer",
-            headers={"X-API-Key": "test"},
-        )
+    def __init__(self, first=None, *, firsts=None, rows=(), add_exc=None):
+        self._first = first
+        self._firsts = None if firsts is None else iter(firsts)
+        self._rows = list(rows)
+        self._add_exc = add_exc
+        self.added = []
+        self.commits = 0
 
-        self.assertEqual(response.status_code, 200)
-        self.assertIn("user_id", response.json())
-        session.add.assert_called_once()
-        session.commit.assert_called_once()
-        user_in_db: InferredUser = session.add.call_args[0][0]
-        self.assertEqual(user_in_db.id, response.json()["user_id"])
-        self.assertEqual(user_in_db.origin_referrer, "test_referer")
+    def execute(self, statement):
+        return self
 
-    @mock.patch("src.app.services.sql_db.queries_user.session_maker")
-    async def test_create_user_when_already_exists(self, session_maker_mock, *mocks):
-        """Si user_id fourni et trouvé, retourne le même id sans créer"""
-        session = MagicMock()
-        session.execute.return_value.first.return_value = MagicMock(
-            id="cfc8072c-a055-442a-9878-b5a73d9141b2"
-        )
-        session_maker_mock.return_value.__enter__.return_value = session
+    def first(self):
+        return self._first if self._firsts is None else next(self._firsts)
+
+    def all(self):
+        return self._rows
+
+    def add(self, instance):
+        if self._add_exc is not None:
+            raise self._add_exc
+        self.added.append(instance)
+
+    def commit(self):
+        self.commits += 1
+
+
+class FakeSessionMaker:
+    """Stands in for ``session_maker``, yielding the session of the running test."""
+
+    session = None
+
+    def __call__(self):
+        return self
+
+    def __enter__(self):
+        return self.session
+
+    def __exit__(self, *exc_info):
+        return False
 
-        response = client.post(
-            f"{settings.API_V1_STR}/user/user",
-            params={"user_id": "cfc8072c-a055-442a-9878-b5a73d9141b2"},
-            headers={"X-API-Key": "test"},
-        )
 
-        self.assertEqual(response.status_code, 200)
-        self.assertEqual(
-            response.json(), {"user_id": "cfc8072c-a055-442a-9878-b5a73d9141b2"}
+@pytest.fixture(scope="module", autouse=True)
+def user_session_maker():
+    # swapped once for the module, each test configures the session it needs
+    session_maker = FakeSessionMaker()
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setattr(queries_user, "session_maker", session_maker)
+        yield session_maker
+
+
+@pytest.fixture
+def mk_session(user_session_maker):
+    def _mk_session(*args, **kwargs):
+        """Hand a fresh FakeSession to the swapped session_maker."""
+        session = user_session_maker.session = FakeSession(*args, **kwargs)
+        return session
+
+    yield _mk_session
+    user_session_maker.session = None
+
+
+@pytest.fixture
+def router_mocks():
+    # spec_set: the endpoints only call these, any other attribute access fails
+    with mock.patch(
+        "src.app.user.api.router.run_in_threadpool", spec_set=True
+    ) as run_in_threadpool, mock.patch(
+        "src.app.user.api.router.resolve_user_and_session", spec_set=True
+    ) as resolve_user_and_session:
+        yield SimpleNamespace(
+            run_in_threadpool=run_in_threadpool,
+            resolve_user_and_session=resolve_user_and_session,
         )
-        session.add.assert_not_called()
-        session.commit.assert_not_called()
 
-    @mock.patch("src.app.services.sql_db.queries_user.session_maker")
-    async def test_create_user_when_already_exists_with_referer(
-        self, session_maker_mock, *mocks
+
+class TestUserApi:
+    @pytest.mark.parametrize(
+        "params, referer",
+        [({}, None), ({"referer": "test_referer"}, "test_referer")],
+        ids=["no_referer", "referer"],
+    )
+    async def test_create_user_when_not_exists(
+        self, mk_session, aclient, params, referer
     ):
+        """Si user_id non fourni, crée un nouvel utilisateur"""
+        session = mk_session()
+
+        response = await aclient.post(USER_URL, params=params)
+
+        assert response.status_code == 200
+        body = response.json()
+        assert "user_id" in body
+        assert len(session.added) == 1
+        assert session.commits == 1
+        user_in_db: InferredUser = session.added[0]
+        assert user_in_db.id == body["user_id"]
+        assert user_in_db.origin_referrer == referer
+
+    @pytest.mark.parametrize(
+        "params",
+        [{}, {"referer": "test_referer"}],
+        ids=["no_referer", "referer"],
+    )
+    async def test_create_user_when_already_exists(self, mk_session, aclient, params):
         """Si user_id fourni et trouvé, retourne le même id sans créer"""
-        session = MagicMock()
-        session.execute.return_value.first.return_value = MagicMock(
-            id="cfc8072c-a055-442a-9878-b5a73d9141b2"
-        )
-        session_maker_mock.return_value.__enter__.return_value = session
-
-        response = client.post(
-            f"{settings.API_V1_STR}/user/user",
-            params={
-                "user_id": "cfc8072c-a055-442a-9878-b5a73d9141b2",
-                "referer": "test_referer",
-            },
-            headers={"X-API-Key": "test"},
-        )
+        session = mk_session(USER_ROW)
 
-        self.assertEqual(response.status_code, 200)
-        self.assertEqual(
-            response.json(), {"user_id": "cfc8072c-a055-442a-9878-b5a73d9141b2"}
-        )
-        session.add.assert_not_called()
-        session.commit.assert_not_called()
+        response = await aclient.post(USER_URL, params={"user_id": USER_ID, **params})
+
+        assert response.status_code == 200
+        assert response.json() == {"user_id": USER_ID}
+        assert session.added == []
+        assert session.commits == 0
 
-    @mock.patch("src.app.services.sql_db.queries_user.session_maker")
-    async def test_create_user_handles_exception(self, session_maker_mock, *mocks):
+    async def test_create_user_handles_exception(self, mk_session, aclient):
         """Simule une erreur DB et vérifie que l’API renvoie 500"""
-        session = MagicMock()
-        session.add.side_effect = Exception("db error")
-        session_maker_mock.return_value.__enter__.return_value = session
+        mk_session(add_exc=Exception("db error"))
 
-        response = client.post(
-            f"{settings.API_V1_STR}/user/user",
-            headers={"X-API-Key": "test"},
-        )
+        response = await aclient.post(USER_URL)
 
-        self.assertEqual(response.status_code, 500)
-        self.assertIn("db error", response.json()["detail"])
+        assert response.status_code == 500
+        assert "db error" in response.json()["detail"]
 
-    @mock.patch("src.app.services.sql_db.queries_user.session_maker")
-    async def test_create_session_user_not_found(self, session_maker_mock, *mocks):
+    async def test_create_session_user_not_found(self, mk_session, aclient):
         """User inexistant -> 404"""
-        session = MagicMock()
-        session.execute.return_value.first.return_value = None
-        session_maker_mock.return_value.__enter__.return_value = session
+        mk_session()
 
         user_id = "bdb62bb2-1fe5-4d14-92fd-60a041355aea"
-        response = client.post(
-            f"{settings.API_V1_STR}/user/session",
-            params={"user_id": user_id},
-            headers={"X-API-Key": "test"},
-        )
-        self.assertEqual(response.status_code, 404)
+        response = await aclient.post(SESSION_URL, params={"user_id": user_id})
+        assert response.status_code == 404
 
-    @mock.patch("src.app.services.sql_db.queries_user.session_maker")
-    async def test_create_session_existing_valid_session(
-        self, session_maker_mock, *mocks
-    ):
+    async def test_create_session_existing_valid_session(self, mk_session, aclient):
         """User et session existants -> retourne la session existante"""
-        session = MagicMock()
-        session.execute.return_value.first.side_effect = [
-            MagicMock(id="cfc8072c-a055-442a-9878-b5a73d9141b2"),  # check user exists
-            MagicMock(
-                id="bdb62bb2-1fe5-4d14-92fd-60a041355aea"
-            ),  # check session exists
-        ]
-        session_maker_mock.return_value.__enter__.return_value = session
-
-        response = client.post(
-            f"{settings.API_V1_STR}/user/session",
-            params={
-                "user_id": "cfc8072c-a055-442a-9878-b5a73d9141b2",
-                "session_id": "bdb62bb2-1fe5-4d14-92fd-60a041355aea",
-            },
-            headers={"X-API-Key": "test"},
-        )
-        self.assertEqual(response.status_code, 200)
-        self.assertEqual(
-            response.json(), {"session_id": "bdb62bb2-1fe5-4d14-92fd-60a041355aea"}
-        )
+        mk_session(firsts=[USER_ROW, SESSION_ROW])
 
-    @mock.patch("src.app.services.sql_db.queries_user.session_maker")
-    async def test_create_session_create_new_when_not_found(
-        self, session_maker_mock, *mocks
-    ):
-        """User existant mais session non trouvée -> crée nouvelle session"""
-        session = MagicMock()
-        session.execute.return_value.first.side_effect = [MagicMock(id="user-1"), None]
-        session_maker_mock.return_value.__enter__.return_value = session
-
-        response = client.post(
-            f"{settings.API_V1_STR}/user/session",
-            params={"user_id": "cfc8072c-a055-442a-9878-b5a73d9141b2"},
-            headers={"X-API-Key": "test"},
+        response = await aclient.post(
+            SESSION_URL, params={"user_id": USER_ID, "session_id": SESSION_ID}
         )
-        self.assertEqual(response.status_code, 200)
-        self.assertIn("session_id", response.json())
-        session.add.assert_called_once()
-        session.commit.assert_called_once()
-
-    @mock.patch("src.app.services.sql_db.queries_user.session_maker")
-    async def test_create_session_create_new_when_not_found_with_referer(
-        self, session_maker_mock, *mocks
+        assert response.status_code == 200
+        assert response.json() == {"session_id": SESSION_ID}
+
+    @pytest.mark.parametrize(
+        "params, referer",
+        [({}, None), ({"referer": "test_referer"}, "test_referer")],
+        ids=["no_referer", "referer"],
+    )
+    async def test_create_session_create_new_when_not_found(
+        self, mk_session, aclient, params, referer
     ):
         """User existant mais session non trouvée -> crée nouvelle session"""
-        session = MagicMock()
-        session.execute.return_value.first.side_effect = [MagicMock(id="user-1"), None]
-        session_maker_mock.return_value.__enter__.return_value = session
-
-        response = client.post(
-            f"{settings.API_V1_STR}/user/session",
-            params={
-                "user_id": "cfc8072c-a055-442a-9878-b5a73d9141b2",
-                "referer": "test_referer",
-            },
-            headers={"X-API-Key": "test"},
+        session = mk_session(firsts=[USER_ROW, None])
+
+        response = await aclient.post(
+            SESSION_URL, params={"user_id": USER_ID, **params}
         )
-        self.assertEqual(response.status_code, 200)
-        self.assertIn("session_id", response.json())
-        session.add.assert_called_once()
-        session.commit.assert_called_once()
+        assert response.status_code == 200
+        assert "session_id" in response.json()
+        assert len(session.added) == 1
+        assert session.commits == 1
 
-        session_in_db: Session = session.add.call_args[0][0]
-        self.assertEqual(response.status_code, 200)
-        self.assertEqual(session_in_db.origin_referrer, "test_referer")
+        session_in_db: Session = session.added[0]
+        assert session_in_db.origin_referrer == referer
 
-    @mock.patch("src.app.services.sql_db.queries_user.session_maker")
-    async def test_get_user_bookmarks_user_not_found(self, session_maker_mock, *mocks):
+    async def test_get_user_bookmarks_user_not_found(self, mk_session, aclient):
         """Bookmarks pour user inexistant -> 404"""
-        session = MagicMock()
-        session.execute.return_value.first.return_value = None
-        session_maker_mock.return_value.__enter__.return_value = session
+        mk_session()
 
         user_id = "11111111-1111-1111-1111-111111111111"
-        response = client.get(
-            f"{settings.API_V1_STR}/user/:user_id/bookmarks",
-            params={"user_id": user_id},
-            headers={"X-API-Key": "test"},
-        )
-        self.assertEqual(response.status_code, 404)
+        response = await aclient.get(USER_BOOKMARKS_URL, params={"user_id": user_id})
+        assert response.status_code == 404
 
-    @mock.patch("src.app.services.sql_db.queries_user.session_maker")
-    async def test_get_user_bookmarks_success_empty(self, session_maker_mock, *mocks):
+    async def test_get_user_bookmarks_success_empty(self, mk_session, aclient):
         """Bookmarks existants -> liste vide si pas de bookmarks"""
-        session = MagicMock()
-        session.execute.return_value.first.return_value = MagicMock(id="user-1")
-        session.execute.return_value.all.return_value = []
-        session_maker_mock.return_value.__enter__.return_value = session
-
-        response = client.get(
-            f"{settings.API_V1_STR}/user/bookmarks",
-            headers={"X-API-Key": "test"},
-            cookies={"x-session-id": "bdb62bb2-1fe5-4d14-92fd-60a041355aea"},
+        # session lookup, then user and session checks, then the bookmarks query
+        mk_session(firsts=[SESSION_ENTITY_ROW, USER_ROW, SESSION_ROW, USER_ROW])
+
+        response = await aclient.get(
+            BOOKMARKS_URL, cookies={"x-session-id": SESSION_ID}
         )
-        self.assertEqual(response.status_code, 200)
-        self.assertEqual(response.json(), {"bookmarks": []})
+        assert response.status_code == 200
+        assert response.json() == {"bookmarks": []}
 
-    @mock.patch("src.app.user.api.router.run_in_threadpool")
-    @mock.patch("src.app.user.api.router.resolve_user_and_session")
-    async def test_add_user_bookmark_success(
-        self, resolve_user_and_session_mock, run_in_threadpool_mock, *mocks
-    ):
+    async def test_add_user_bookmark_success(self, router_mocks, aclient):
         """Ajout d'un bookmark - mocks only what is needed"""
         # Mock resolve_user_and_session to return user_id and session_id
         user_id = uuid.UUID("cfc8072c-a055-442a-9878-b5a73d9141b2")
         session_id = uuid.UUID("bdb62bb2-1fe5-4d14-92fd-60a041355aea")
-        resolve_user_and_session_mock.return_value = (user_id, session_id)
+        router_mocks.resolve_user_and_session.return_value = (user_id, session_id)
 
         # Mock run_in_threadpool to simulate DB add_user_bookmark_sync
         document_id = "ffffffff-ffff-ffff-ffff-ffffffffffff"
-        run_in_threadpool_mock.return_value = document_id
+        router_mocks.run_in_threadpool.return_value = document_id
 
-        response = client.post(
-            f"{settings.API_V1_STR}/user/bookmarks/:document_id",
+        response = await aclient.post(
+            BOOKMARK_URL,
             params={"document_id": document_id},
-            headers={"X-API-Key": "test"},
             cookies={"x-session-id": str(session_id)},
         )
-        self.assertEqual(response.status_code, 200)
-        self.assertEqual(response.json(), {"added": document_id})
-        resolve_user_and_session_mock.assert_called_once()
-        run_in_threadpool_mock.assert_called_once()
-
-    @mock.patch("src.app.user.api.router.run_in_threadpool")
-    @mock.patch("src.app.user.api.router.resolve_user_and_session")
-    async def test_add_user_bookmark_user_not_found(
-        self, resolve_user_and_session_mock, run_in_threadpool_mock, *mocks
+        assert response.status_code == 200
+        assert response.json() == {"added": document_id}
+        router_mocks.resolve_user_and_session.assert_called_once()
+        router_mocks.run_in_threadpool.assert_called_once()
+
+    @pytest.mark.parametrize(
+        "url, request_kwargs",
+        [
+            (
+                BOOKMARK_URL,
+                {"params": {"document_id": "ffffffff-ffff-ffff-ffff-ffffffffffff"}},
+            ),
+            (
+                INSTITUTION_DATA_URL,
+                {"json": {"institution": "Test University", "role": "Student"}},
+            ),
+        ],
+        ids=["bookmark", "institution_data"],
+    )
+    async def test_add_user_data_user_not_found(
+        self, router_mocks, aclient, url, request_kwargs
     ):
-        """Ajout d'un bookmark - mocks only what is needed"""
-        # Mock resolve_user_and_session to return user_id and session_id
-        user_id = uuid.UUID("cfc8072c-a055-442a-9878-b5a73d9141b2")
+        """Ajout d'un bookmark ou d'une institution pour un user inexistant -> 404"""
         session_id = uuid.UUID("bdb62bb2-1fe5-4d14-92fd-60a041355aea")
 
         # mock error for user not found
-        resolve_user_and_session_mock.side_effect = UserNotFoundError("User not found")
-        resolve_user_and_session_mock.return_value = (user_id, session_id)
-
-        # Mock run_in_threadpool to simulate DB add_user_bookmark_sync
-        document_id = "ffffffff-ffff-ffff-ffff-ffffffffffff"
-        run_in_threadpool_mock.return_value = document_id
-
-        response = client.post(
-            f"{settings.API_V1_STR}/user/bookmarks/:document_id",
-            params={"document_id": document_id},
-            headers={"X-API-Key": "test"},
-            cookies={"x-session-id": str(session_id)},
-        )
-        self.assertEqual(response.status_code, 404)
-        self.assertEqual(
-            response.json(), {"detail": "('User not found', 'USER_NOT_FOUND')"}
+        router_mocks.resolve_user_and_session.side_effect = UserNotFoundError(
+            "User not found"
         )
-        resolve_user_and_session_mock.assert_called_once()
-        run_in_threadpool_mock.assert_not_called()
 
-    @mock.patch("src.app.user.api.router.run_in_threadpool")
-    @mock.patch("src.app.user.api.router.resolve_user_and_session")
-    async def test_add_user_institution_data_user_not_found(
-        self, resolve_user_and_session_mock, run_in_threadpool_mock, *mocks
-    ):
-        """Ajout d'un bookmark - mocks only what is needed"""
-        # Mock resolve_user_and_session to return user_id and session_id
-        user_id = uuid.UUID("cfc8072c-a055-442a-9878-b5a73d9141b2")
-        session_id = uuid.UUID("bdb62bb2-1fe5-4d14-92fd-60a041355aea")
-
-        # mock error for user not found
-        resolve_user_and_session_mock.side_effect = UserNotFoundError("User not found")
-        resolve_user_and_session_mock.return_value = (user_id, session_id)
-
-        # Mock run_in_threadpool to simulate DB add_user_bookmark_sync
-        document_id = "ffffffff-ffff-ffff-ffff-ffffffffffff"
-        run_in_threadpool_mock.return_value = document_id
-
-        response = client.post(
-            f"{settings.API_V1_STR}/user/institution-data",
-            json={"institution": "Test University", "role": "Student"},
-            headers={"X-API-Key": "test"},
-            cookies={"x-session-id": str(session_id)},
-        )
-        self.assertEqual(response.status_code, 404)
-        self.assertEqual(
-            response.json(), {"detail": "('User not found', 'USER_NOT_FOUND')"}
+        response = await aclient.post(
+            url, cookies={"x-session-id": str(session_id)}, **request_kwargs
         )
-        resolve_user_and_session_mock.assert_called_once()
-        run_in_threadpool_mock.assert_not_called()
+        assert response.status_code == 404
+        assert response.json() == {"detail": "('User not found', 'USER_NOT_FOUND')"}
+        router_mocks.resolve_user_and_session.assert_called_once()
+        router_mocks.run_in_threadpool.assert_not_called()
 
-    @mock.patch("src.app.user.api.router.run_in_threadpool")
-    @mock.patch("src.app.user.api.router.resolve_user_and_session")
-    async def test_add_user_institution_data_success(
-        self, resolve_user_and_session_mock, run_in_threadpool_mock, *mocks
-    ):
+    async def test_add_user_institution_data_success(self, router_mocks, aclient):
         """Ajout d'un institution data - mocks only what is needed"""
         # Mock resolve_user_and_session to return user_id and session_id
         user_id = uuid.UUID("cfc8072c-a055-442a-9878-b5a73d9141b2")
         session_id = uuid.UUID("bdb62bb2-1fe5-4d14-92fd-60a041355aea")
-        resolve_user_and_session_mock.return_value = (user_id, session_id)
+        router_mocks.resolve_user_and_session.return_value = (user_id, session_id)
 
         # Mock run_in_threadpool to simulate DB add_institution_data_to_user_sync
         document_id = "ffffffff-ffff-ffff-ffff-ffffffffffff"
-        run_in_threadpool_mock.return_value = document_id
+        router_mocks.run_in_threadpool.return_value = document_id
 
-        response = client.post(
-            f"{settings.API_V1_STR}/user/institution-data",
+        response = await aclient.post(
+            INSTITUTION_DATA_URL,
             json={"institution": "Test University", "role": "Student"},
-            headers={"X-API-Key": "test"},
             cookies={"x-session-id": str(session_id)},
         )
-        self.assertEqual(response.status_code, 200)
-        self.assertEqual(
-            response.json(),
-            {
-                "message": "Institution data added to user",
-                "institution": "Test University",
-                "role": "Student",
-            },
-        )
-        resolve_user_and_session_mock.assert_called_once()
-        run_in_threadpool_mock.assert_called_once()
+        assert response.status_code == 200
+        assert response.json() == {
+            "message": "Institution data added to user",
+            "institution": "Test University",
+            "role": "Student",
+        }
+        router_mocks.resolve_user_and_session.assert_called_once()
+        router_mocks.run_in_threadpool.assert_called_once()
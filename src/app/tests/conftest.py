@@ -1,15 +1,81 @@
-from unittest.mock import AsyncMock
+import asyncio
+from unittest.mock import AsyncMock, patch
 
+import backoff
+import httpx
 import pytest
+import pytest_asyncio
 from fastapi.testclient import TestClient
 
-from src.app.search.services.search import get_qdrant
-from src.main import app
 
+def pytest_configure(config):
+    # backoff decorators are bound when the endpoint modules are imported, which
+    # happens while test modules are collected: neutralise them before that.
+    backoff.on_exception = lambda *args, **kwargs: (lambda func: func)
 
-@pytest.fixture(scope="class")
+
+@pytest.fixture(scope="session")
+def event_loop_policy():
+    try:
+        import uvloop
+    except ImportError:  # installed with uvicorn[standard], except on Windows
+        return asyncio.DefaultEventLoopPolicy()
+    return uvloop.EventLoopPolicy()
+
+
+@pytest.fixture(scope="session", autouse=True)
+def dependency_overrides():
+    from src.app.search.services.search import get_qdrant
+    from src.app.shared.infra.abst_chat import get_llm_client
+    from src.app.shared.infra.security import get_user
+    from src.main import app
+
+    # ASGITransport does not run the lifespan that sets these clients on app.state
+    overrides = {
+        get_user: lambda: "ok",
+        get_qdrant: lambda: AsyncMock(),
+        get_llm_client: lambda: AsyncMock(),
+    }
+    app.dependency_overrides.update(overrides)
+    yield
+    for dependency in overrides:
+        app.dependency_overrides.pop(dependency, None)
+
+
+@pytest.fixture(scope="session", autouse=True)
+def session_maker_mock():
+    with patch("src.app.services.sql_db.queries.session_maker") as session_maker:
+        yield session_maker
+
+
+@pytest.fixture(autouse=True)
+def _reset_session_maker_mock(session_maker_mock):
+    yield
+    session_maker_mock.reset_mock(return_value=True, side_effect=True)
+
+
+@pytest.fixture(autouse=True)
+def _clear_query_embeddings_cache():
+    from src.app.search.services.search import query_embeddings_cache
+
+    yield
+    query_embeddings_cache.clear()
+
+
+@pytest.fixture(scope="session")
 def client():
-    app.dependency_overrides[get_qdrant] = lambda: AsyncMock()
-    with TestClient(app) as client:
+    from src.main import app
+
+    with TestClient(app, headers={"X-API-Key": "test"}) as client:
+        yield client
+
+
+@pytest_asyncio.fixture(scope="session", loop_scope="session")
+async def aclient():
+    from src.main import app
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(
+        transport=transport, base_url="http://test", headers={"X-API-Key": "test"}
+    ) as client:
         yield client
-    app.dependency_overrides.clear()
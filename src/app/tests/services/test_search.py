@@ -1,25 +1,48 @@
 import os
+from types import MappingProxyType
 from typing import List
-from unittest import IsolatedAsyncioTestCase, mock
+from unittest import IsolatedAsyncioTestCase, TestCase, mock
 
+import numpy as np
+from fastapi import BackgroundTasks
+from qdrant_client.http.exceptions import ResponseHandlingException
+from qdrant_client.http.models import QueryResponse
 from qdrant_client.models import CollectionDescription, CollectionsResponse, ScoredPoint
 
 from src.app.models.collections import Collection
-from src.app.search.services.search import SearchService, concatenate_same_doc_id_slices
+from src.app.search.helpers.search_helpers import search_multi_inputs
+from src.app.search.models.search import EnhancedSearchQuery
+from src.app.search.services.search import (
+    QueryEmbeddingCache,
+    SearchService,
+    concatenate_same_doc_id_slices,
+    get_search_service,
+    query_embeddings_cache,
+    sort_slices_using_mmr,
+)
 
 os.environ["USE_CACHED_SETTINGS"] = "False"
 
 
 class FakeQdrantClient:
+    def __init__(self):
+        self.batch_points: list[list[ScoredPoint]] = []
+        self.batch_calls: list[tuple] = []
+
     async def get_collections(self):
         class Collections:
             collections = [
                 type("C", (), {"name": "collection_welearn_fr_exists"}),
                 type("C", (), {"name": "collection_welearn_en_exists"}),
+                type("C", (), {"name": "collection_welearn_mul_exists"}),
             ]
 
         return Collections()
 
+    async def query_batch_points(self, collection_name, requests):
+        self.batch_calls.append((collection_name, requests))
+        return [QueryResponse(points=points) for points in self.batch_points]
+
 
 class alternate_mock_method(object):
     def __init__(self, url: str, timeout: int, port: int, **kwargs):
@@ -38,9 +61,60 @@ collections = CollectionsResponse(
     ]
 )
 
+scored_point_payload = MappingProxyType(
+    {
+        "document_corpus": "corpus",
+        "document_desc": "desc",
+        "document_details": {},
+        "document_id": "1",
+        "document_lang": "fr",
+        "document_sdg": [1],
+        "document_title": "title",
+        "document_url": "url",
+        "slice_content": "content",
+        "slice_sdg": 1,
+    }
+)
+# trusted literals: model_construct skips the pydantic validation of each point
+mocked_scored_points = tuple(
+    ScoredPoint.model_construct(
+        id=point_id,
+        version=1,
+        score=score,
+        vector=vector,
+        payload=dict(scored_point_payload),
+    )
+    for point_id, score, vector in (
+        ("1", 0.9, [0.1, 0.2]),
+        ("2", 0.89, [0.11, 0.21]),
+        ("3", 0.88, [0.3, 0.4]),
+    )
+)
 
-def fake_callback_function(embedding, nb_results, filters, collection_info):
-    return f"{embedding}, {nb_results}, {filters}, {collection_info}"
+
+def _reference_mmr(points, theta):
+    """Straight MMR: every pick recomputes the similarity to the whole selection"""
+    vectors = np.array([p.vector for p in points], dtype=np.float64)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    similarities = vectors @ vectors.T
+    scores = np.array([p.score for p in points])
+    selected = [0]
+    remaining = list(range(1, len(points)))
+    while remaining:
+        sim = similarities[np.ix_(remaining, selected)]
+        mmr = theta * scores[remaining] - (1 - theta) * sim.max(axis=1)
+        selected.append(remaining.pop(int(np.argmax(mmr))))
+    return [points[i] for i in selected]
+
+
+def _batch_point(point_id: int, score: float, title: str) -> ScoredPoint:
+    return ScoredPoint(
+        id=point_id,
+        version=1,
+        score=score,
+        vector=[float(point_id), 1.0],
+        payload={**scored_point_payload, "document_title": title},
+    )
 
 
 class SearchServiceTests(IsolatedAsyncioTestCase):
@@ -83,6 +157,197 @@ class SearchServiceTests(IsolatedAsyncioTestCase):
             self.assertEqual(collection.name, "collection_welearn_fr_exists")
             self.assertEqual(collection, exp_collection)
 
+    async def test_search_batch_one_request_per_embedding(self):
+        points = [ScoredPoint(id=1, version=1, score=0.9, payload={})]
+        self.qdrant.query_batch_points = mock.AsyncMock(
+            return_value=[QueryResponse(points=points), QueryResponse(points=[])]
+        )
+
+        results = await self.sp.search_batch(
+            collection_info="collection_welearn_fr_exists",
+            embeddings=[np.array([0.1, 0.2]), np.array([0.3, 0.4])],
+            nb_results=5,
+        )
+
+        self.assertEqual(results, [points, []])
+        self.qdrant.query_batch_points.assert_awaited_once()
+        requests = self.qdrant.query_batch_points.call_args.kwargs["requests"]
+        self.assertEqual([r.query for r in requests], [[0.1, 0.2], [0.3, 0.4]])
+        self.assertTrue(all(r.limit == 5 for r in requests))
+
+    async def test_search_batch_handler_ranks_each_query_results(self):
+        # mmr keeps the top hit first and re-ranks the slices after it
+        self.qdrant.batch_points = [
+            [
+                _batch_point(1, 0.9, "a1"),
+                _batch_point(2, 0.6, "a2"),
+                _batch_point(3, 0.8, "a3"),
+            ],
+            [
+                _batch_point(4, 0.85, "b1"),
+                _batch_point(5, 0.5, "b2"),
+                _batch_point(6, 0.7, "b3"),
+            ],
+        ]
+        qp = EnhancedSearchQuery(
+            query=["first", "second"],
+            subject="maths",
+            influence_factor=2,
+            concatenate=False,
+        )
+
+        with (
+            mock.patch(
+                "src.app.search.services.search.get_subject_vector",
+                return_value=[1.0, 0.0],
+            ) as subject_vector,
+            mock.patch.object(
+                SearchService,
+                "_embed_queries",
+                return_value=[np.array([0.1, 0.2]), np.array([0.3, 0.4])],
+            ),
+            mock.patch(
+                "src.app.search.services.search.sort_slices_using_mmr",
+                wraps=sort_slices_using_mmr,
+            ) as mmr,
+        ):
+            results = await self.sp.search_batch_handler(
+                background_tasks=BackgroundTasks(), qp=qp
+            )
+
+        subject_vector.assert_called_once_with("maths", "exists")
+        self.assertEqual(len(self.qdrant.batch_calls), 1)
+        collection_name, requests = self.qdrant.batch_calls[0]
+        self.assertEqual(collection_name, "collection_welearn_mul_exists")
+        np.testing.assert_allclose(requests[0].query, [2.1, 0.2])
+        np.testing.assert_allclose(requests[1].query, [2.3, 0.4])
+        self.assertEqual(mmr.call_count, 2)
+        self.assertEqual([[p.id for p in r] for r in results], [[1, 3, 2], [4, 6, 5]])
+
+    async def test_search_batch_handler_on_qdrant_error(self):
+        self.qdrant.query_batch_points = mock.AsyncMock(
+            side_effect=ResponseHandlingException(Exception("timeout"))
+        )
+        qp = EnhancedSearchQuery(query=["first", "second"])
+
+        with mock.patch.object(
+            SearchService,
+            "_embed_queries",
+            return_value=[np.array([0.1, 0.2]), np.array([0.3, 0.4])],
+        ):
+            results = await self.sp.search_batch_handler(
+                background_tasks=BackgroundTasks(), qp=qp
+            )
+            merged = await search_multi_inputs(
+                background_tasks=BackgroundTasks(),
+                qp=qp,
+                batch_search_handler=self.sp.search_batch_handler,
+            )
+
+        self.assertEqual(results, [[], []])
+        self.assertEqual(merged, [])
+
+    async def test_embed_queries_averages_each_query_chunks(self):
+        self.sp.model = {
+            "m": {"max_seq_length": 10, "instance": None, "tokenizer": None}
+        }
+        with mock.patch.object(
+            SearchService,
+            "_compute_embeddings",
+            return_value=np.array([[1.0, 1.0], [3.0, 3.0], [5.0, 7.0]]),
+        ) as compute:
+            embeddings = await self.sp._embed_queries(
+                ["first long query", "short"], "m"
+            )
+
+        compute.assert_called_once_with(None, None, ["first long", "query", "short"])
+        np.testing.assert_array_equal(embeddings[0], [2.0, 2.0])
+        np.testing.assert_array_equal(embeddings[1], [5.0, 7.0])
+
+    async def test_embed_queries_reuses_cached_query_embeddings(self):
+        self.sp.model = {
+            "m": {"max_seq_length": 10, "instance": None, "tokenizer": None}
+        }
+        with mock.patch.object(
+            SearchService,
+            "_compute_embeddings",
+            side_effect=[np.array([[1.0, 1.0]]), np.array([[3.0, 5.0]])],
+        ) as compute:
+            await self.sp._embed_queries(["short"], "m")
+            embeddings = await self.sp._embed_queries(["other", "short"], "m")
+
+        self.assertEqual(compute.call_count, 2)
+        compute.assert_called_with(None, None, ["other"])
+        np.testing.assert_array_equal(embeddings[0], [3.0, 5.0])
+        np.testing.assert_array_equal(embeddings[1], [1.0, 1.0])
+
+    async def test_embed_query_reuses_cached_embedding(self):
+        self.sp.model = {
+            "m": {"max_seq_length": 10, "instance": None, "tokenizer": None}
+        }
+        with mock.patch.object(
+            SearchService,
+            "_compute_embeddings",
+            return_value=np.array([[1.0, 3.0]]),
+        ) as compute:
+            first = await self.sp._embed_query("short", "m")
+            second = await self.sp._embed_query("short", "m")
+
+        compute.assert_called_once()
+        self.assertIs(second, first)
+        np.testing.assert_array_equal(second, [1.0, 3.0])
+
+    async def test_embed_query_raises_embed_error_without_caching(self):
+        self.sp.model = {
+            "m": {"max_seq_length": 10, "instance": None, "tokenizer": None}
+        }
+        with mock.patch.object(
+            SearchService, "_compute_embeddings", side_effect=ValueError("boom")
+        ):
+            with self.assertRaises(RuntimeError) as ctx:
+                await self.sp._embed_query("short", "m")
+
+        self.assertEqual(ctx.exception.args[1], "EMBED_ERROR")
+        self.assertNotIn(("m", "short"), self.sp.query_embeddings)
+
+    async def test_embed_query_evicts_least_recently_used_embedding(self):
+        self.sp = SearchService(
+            client=self.qdrant, query_embeddings=QueryEmbeddingCache(maxsize=2)
+        )
+        self.sp.model = {
+            "m": {"max_seq_length": 10, "instance": None, "tokenizer": None}
+        }
+        with mock.patch.object(
+            SearchService,
+            "_compute_embeddings",
+            side_effect=lambda model, tokenizer, inputs: np.ones((len(inputs), 2)),
+        ) as compute:
+            for search_input in ("a", "b", "a", "c"):
+                await self.sp._embed_query(search_input, "m")
+
+            # "a" was used again after "b", so "b" is the one evicted for "c"
+            self.assertEqual(compute.call_count, 3)
+            self.assertEqual(len(self.sp.query_embeddings), 2)
+            self.assertIn(("m", "a"), self.sp.query_embeddings)
+            self.assertIn(("m", "c"), self.sp.query_embeddings)
+            self.assertNotIn(("m", "b"), self.sp.query_embeddings)
+
+            await self.sp._embed_query("b", "m")
+
+        self.assertEqual(compute.call_count, 4)
+        self.assertNotIn(("m", "a"), self.sp.query_embeddings)
+
+    async def test_search_services_share_the_request_cache_only(self):
+        services = [await get_search_service(self.qdrant) for _ in range(2)]
+
+        for service in services:
+            self.assertIs(service.query_embeddings, query_embeddings_cache)
+        self.assertIsNot(self.sp.query_embeddings, query_embeddings_cache)
+        self.assertIsNot(
+            SearchService(client=self.qdrant).query_embeddings,
+            self.sp.query_embeddings,
+        )
+
     def test_concatenate_same_doc_id_slices(self):
 
         qdrant_docs: List[ScoredPoint] = [
@@ -123,3 +388,38 @@ class SearchServiceTests(IsolatedAsyncioTestCase):
         self.assertEqual(len(results), 2)
         self.assertEqual(results[0].payload, expected_result[0].payload)
         self.assertEqual(results[1].payload, expected_result[1].payload)
+
+
+class SortSlicesUsingMMRTests(TestCase):
+    def test_sort_slices_using_mmr_default_theta(self):
+        sorted_points = sort_slices_using_mmr(mocked_scored_points)
+        self.assertEqual(sorted_points, list(mocked_scored_points))
+
+    def test_sort_slices_using_mmr_custom_theta(self):
+        theta = 0.5
+        sorted_points = sort_slices_using_mmr(mocked_scored_points, theta)
+        self.assertEqual(
+            sorted_points,
+            [
+                mocked_scored_points[0],
+                mocked_scored_points[2],
+                mocked_scored_points[1],
+            ],
+        )
+
+    def test_sort_slices_using_mmr_matches_reference_on_random_points(self):
+        rng = np.random.default_rng(0)
+        vectors = rng.standard_normal((512, 384), dtype=np.float32)
+        points = [
+            ScoredPoint.model_construct(
+                id=str(i), version=1, score=1 - i / 512, vector=vectors[i].tolist()
+            )
+            for i in range(512)
+        ]
+
+        for theta in (1.0, 0.75, 0.5):
+            with self.subTest(theta=theta):
+                self.assertEqual(
+                    [p.id for p in sort_slices_using_mmr(points, theta)],
+                    [p.id for p in _reference_mmr(points, theta)],
+                )
@@ -126,7 +126,7 @@ async def tutor_search_extract(
         search_results = await search_multi_inputs(
             qp=qp,
             background_tasks=background_tasks,
-            callback_function=sp.search_handler,
+            batch_search_handler=sp.search_batch_handler,
         )
     except NoResultsError as e:
         response.status_code = 404